@@ -4,6 +4,7 @@ A file containing some example code demonstrating how to turn .lss files into sp
 from speedrun_models import BasicSpeedrunModel
 from reset_strategies import get_strategy
 from lss_reader import LSSReader, time_to_float
+from record_time_distribution import get_record_time_distribution
 
 
 def main():
@@ -28,6 +29,9 @@ def main():
     # print the results
     print(f"expected record time = {round(1/record_density/60, 1)} minutes")
     print("splits to reset at: " + " ".join(str(round(x, 1)) for x in strategy.reset_splits))
+    # compute the distribution of the time until the first record to see how long it might take
+    record_time_distribution = get_record_time_distribution(strategy)
+    print(f"90% chance of a record within {round(record_time_distribution.quantile(0.9)/60, 1)} minutes")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,135 @@
+"""
+A python file containing classes and methods for fitting compact parametric distributions to segment data.
+"""
+from speedrun_models import SplitDistribution
+import dataclasses
+import numpy as np
+
+
+# the cumulative distribution function of the standard normal distribution, applied to each entry of an array. This
+# uses the approximation 7.1.26 of the error function from Abramowitz and Stegun, which has an error below 1.5e-7.
+def _standard_normal_cdf(x: np.ndarray) -> np.ndarray:
+    z = np.abs(x) / np.sqrt(2)
+    t = 1 / (1 + 0.3275911 * z)
+    polynomial = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1 - polynomial * np.exp(-z * z)
+    return (1 + np.sign(x) * erf) / 2
+
+
+# choose distinct starting means for the components, one at a time picking the value that is furthest away from the
+# means chosen so far (weighted by how often it occurs), like k-means++ but deterministic
+def _initial_means(x: np.ndarray, component_num: int) -> np.ndarray:
+    values, counts = np.unique(x, return_counts=True)
+    means = [np.median(x)]
+    for _ in range(component_num - 1):
+        distances = np.min((values[:, None] - np.array(means)) ** 2, axis=1) * counts
+        means.append(values[np.argmax(distances)])
+    return np.sort(np.array(means))
+
+
+@dataclasses.dataclass
+class MixtureFit:
+    """
+    A mixture of normal distributions together with a probability of the run being killed, describing the in game time
+    of a segment.
+     - weights, means and sigmas: numpy arrays giving the weight, mean and standard deviation of each component. The
+       weights add up to 1.
+     - run_kill_prob: the probability of the run being killed during the segment
+    Only these few numbers are needed to make a SplitDistribution, so a fit can be stored (see to_dict) and discretized
+    again at a different split_step without going back to the data. Discretized distributions are cached.
+    """
+    weights: np.ndarray
+    means: np.ndarray
+    sigmas: np.ndarray
+    run_kill_prob: float = 0.
+    _cache: dict = dataclasses.field(default_factory=dict, init=False, repr=False, compare=False)
+
+    # gives the number of components of the mixture
+    @property
+    def component_num(self) -> int:
+        return len(self.weights)
+
+    # computes the probability of the segment taking at most x in game time for each entry of an array x, given that
+    # the run is not killed
+    def cdf(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=float)
+        return _standard_normal_cdf((x[..., None] - self.means) / self.sigmas) @ self.weights
+
+    # fits a mixture to a list of data points that are either numbers or the string "run kill" using the expectation
+    # maximization algorithm
+    @classmethod
+    def from_data(cls, data_points, component_num=2, run_kill_threshold=np.PINF, clamp_range=(np.NINF, np.PINF),
+                  max_iterations=500, tolerance=1e-9, min_sigma=1e-3):
+        data_points = [x for x in data_points if isinstance(x, str) or clamp_range[0] <= x <= clamp_range[1]]
+        x = np.array([x for x in data_points if (not isinstance(x, str)) and x < run_kill_threshold], dtype=float)
+        if len(x) == 0:
+            raise ValueError("Cannot fit a distribution to data without any completed segments.")
+        run_kill_prob = 1 - len(x) / len(data_points)
+        component_num = min(component_num, len(np.unique(x)))
+        # start with components at distinct values spread over the data
+        weights = np.full(component_num, 1 / component_num)
+        means = _initial_means(x, component_num)
+        sigmas = np.full(component_num, max(np.std(x) / component_num, min_sigma))
+        log_likelihood = np.NINF
+        for _ in range(max_iterations):
+            # expectation step: compute how responsible each component is for each data point
+            log_densities = (np.log(weights) - np.log(sigmas) - 0.5 * np.log(2 * np.pi)
+                             - 0.5 * ((x[:, None] - means) / sigmas) ** 2)
+            max_log_densities = log_densities.max(axis=1, keepdims=True)
+            densities = np.exp(log_densities - max_log_densities)
+            total_densities = densities.sum(axis=1, keepdims=True)
+            responsibilities = densities / total_densities
+            # maximization step: update the parameters of each component
+            component_weights = responsibilities.sum(axis=0)
+            weights = component_weights / len(x)
+            means = responsibilities.T @ x / component_weights
+            sigmas = np.sqrt(np.sum(responsibilities * (x[:, None] - means) ** 2, axis=0) / component_weights)
+            sigmas = np.maximum(sigmas, min_sigma)
+            # stop when the likelihood of the data stops improving
+            new_log_likelihood = np.mean(np.log(total_densities) + max_log_densities)
+            if new_log_likelihood - log_likelihood < tolerance:
+                break
+            log_likelihood = new_log_likelihood
+        # drop components that are not responsible for any data
+        keep = weights > 0
+        return cls(weights[keep] / np.sum(weights[keep]), means[keep], sigmas[keep], run_kill_prob)
+
+    # gives a SplitDistribution of this fit discretized to split_step, keeping only the splits between the
+    # left_tail_prob and 1-right_tail_prob quantiles of the mixture. The left tail is left out by scaling up the kept
+    # splits, which keeps their relative probabilities, and the right tail is counted as a run kill. Fast times are the
+    # ones that lead to records, so the left tail should be cut off much more carefully than the right one. When
+    # max_split is given, any split above it is counted as a run kill as well. This is useful when such splits can
+    # never lead to a record.
+    def to_split_distribution(self, split_step, left_tail_prob=1e-4, right_tail_prob=1e-2,
+                              max_split=np.PINF) -> SplitDistribution:
+        key = (split_step, left_tail_prob, right_tail_prob, max_split)
+        if key not in self._cache:
+            # the i'th split contains all times that round to i*split_step
+            radius = 10 * np.max(self.sigmas)
+            first_index = round((np.min(self.means) - radius) / split_step)
+            last_index = round((np.max(self.means) + radius) / split_step)
+            edges = (np.arange(first_index, last_index + 2) - 0.5) * split_step
+            cdf = self.cdf(edges)
+            # find the first and last split within the quantiles
+            start = max(np.searchsorted(cdf, left_tail_prob, side="right") - 1, 0)
+            end = min(np.searchsorted(cdf, 1 - right_tail_prob, side="left") - 1, len(edges) - 2)
+            end = max(end, start)
+            if max_split < np.PINF:
+                end = min(end, round(max_split / split_step) - first_index)
+                if end < start:
+                    raise ValueError("The maximum split is below every time of the distribution.")
+            probabilities = np.diff(cdf[start:end + 2]) / (1 - cdf[start])
+            self._cache[key] = SplitDistribution((first_index + start) * split_step, split_step,
+                                                 probabilities * (1 - self.run_kill_prob))
+        return self._cache[key].copy()
+
+    # gives a dictionary of the parameters of this fit that can be stored as json
+    def to_dict(self) -> dict:
+        return {"weights": self.weights.tolist(), "means": self.means.tolist(), "sigmas": self.sigmas.tolist(),
+                "run_kill_prob": self.run_kill_prob}
+
+    # creates a MixtureFit from a dictionary made by to_dict
+    @classmethod
+    def from_dict(cls, parameters: dict):
+        return cls(np.array(parameters["weights"], dtype=float), np.array(parameters["means"], dtype=float),
+                   np.array(parameters["sigmas"], dtype=float), parameters["run_kill_prob"])
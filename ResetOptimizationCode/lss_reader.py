@@ -1,8 +1,10 @@
 """
 A python file containing classes and methods for reading .lss files
 """
-from speedrun_models import SplitDistribution
+from speedrun_models import SplitDistribution, JointSplitDistribution
+from distribution_fitting import MixtureFit
 from xml.etree import ElementTree
+from datetime import datetime
 import numpy as np
 from typing import Tuple
 
@@ -43,6 +45,12 @@ def day_and_time_to_int(string: str):
     return day_time+time
 
 
+# a function for converting (american) day and time strings like "10/26/2022 17:53:03" to a datetime object, used for
+# computing the real time between two of them
+def day_and_time_to_datetime(string: str) -> datetime:
+    return datetime.strptime(string, "%m/%d/%Y %H:%M:%S")
+
+
 # extract either the real time or in game time form an XML tree element
 def read_time_element(element, use_igt: bool):
     time_elt = element.find("GameTime" if use_igt else "RealTime")
@@ -66,8 +74,16 @@ class LSSReader:
         root = ElementTree.fromstring(file_contents)
         # fetch the list of attempts with their id's and the times that they where performed
         self.attempts = dict()
+        # for each attempt also store how many seconds it lasted and the (in game time, real time) pair of each segment
+        self.attempt_durations = dict()
+        self.paired_attempt_times = dict()
         for attempt in root.find("AttemptHistory"):
             self.attempts[attempt.attrib["id"]] = (day_and_time_to_int(attempt.attrib["started"]), [], [])
+            if "ended" in attempt.attrib:
+                duration = day_and_time_to_datetime(attempt.attrib["ended"]) - \
+                           day_and_time_to_datetime(attempt.attrib["started"])
+                self.attempt_durations[attempt.attrib["id"]] = duration.total_seconds()
+            self.paired_attempt_times[attempt.attrib["id"]] = dict()
         # extract the offset
         self.offset = time_to_float(root.find("Offset").text)
         if self.offset != 0:
@@ -77,7 +93,7 @@ class LSSReader:
         self.segment_names = []
         best_segments = []
         comparison_splits = dict()
-        for segment in segments:
+        for segment_index, segment in enumerate(segments):
             # extract the name of the segment
             self.segment_names.append(segment.find("Name").text)
             # extract the best time for this segment
@@ -97,6 +113,8 @@ class LSSReader:
                     self.attempts[attempt_id][1].append(segment_time)
                 if segment_real_time is not None:
                     self.attempts[attempt_id][2].append(segment_real_time)
+                if segment_time is not None or segment_real_time is not None:
+                    self.paired_attempt_times[attempt_id][segment_index] = (segment_time, segment_real_time)
         # store the comparison segment times
         self.comparison_segments = {"Best Segments": best_segments}
         for name, splits in comparison_splits.items():
@@ -115,24 +133,8 @@ class LSSReader:
             time -= segment_time
         return time
 
-    def get_segment_data(self, segment, min_date=None, max_date=None, compare_to=None,
-                         resets_as_run_kill=False) -> list:
-        """
-        Get a list of the segment times of segment 'segment' for all attempts between min_date and max_date.
-         - segment: an index or a name specifying the segment
-         - min_date, max_date: strings like "10/9/2022", "10/9/2022 10:15" and "10/9/2022 10:15:30"
-         - compare_to: specifies what to save the segment times relative to. It can be:
-            * a float giving the segment time to compare to
-            * equal to "Best Segments" specifying that we should compare to the best segments according to LiveSplit
-            * any other string that is the name of splits from the .lss file
-         - When resets_as_run_kill is set to true, a reset during this segment will be counted as a run kill.
-          This does not work well when you reset for other reasons, like being on a bad pace.
-          Setting this setting to true is best when doing practice runs.
-        """
-        # compare the string dates to integers for easier comparisons
-        min_date_int = np.NINF if min_date is None else day_and_time_to_int(min_date)
-        max_date_int = np.PINF if max_date is None else day_and_time_to_int(max_date)
-        # find the index of the specified segment
+    # find the index of a segment given by either an index or a name
+    def _get_segment_num(self, segment) -> int:
         if isinstance(segment, int):
             if segment >= len(self.segment_names):
                 raise LSSReadingException(f"Invalid segment index {segment}.")
@@ -141,7 +143,10 @@ class LSSReader:
             if segment not in self.segment_names:
                 raise LSSReadingException(f"No segment named '{segment}' found.")
             segment_num = self.segment_names.index(segment)
-        # find what we want to compare the splits to based on the 'compare_to' parameter
+        return segment_num
+
+    # find the segment time to compare the times of segment segment_num to
+    def _get_compare_time(self, compare_to, segment_num: int) -> float:
         if compare_to is None:
             compare_time = 0
         elif isinstance(compare_to, float) or isinstance(compare_to, int):
@@ -155,6 +160,29 @@ class LSSReader:
                                           f"type (igt vs real time).")
         else:
             raise ValueError("The value given for compare_to is not None, a number or a string.")
+        return compare_time
+
+    def get_segment_data(self, segment, min_date=None, max_date=None, compare_to=None,
+                         resets_as_run_kill=False) -> list:
+        """
+        Get a list of the segment times of segment 'segment' for all attempts between min_date and max_date.
+         - segment: an index or a name specifying the segment
+         - min_date, max_date: strings like "10/9/2022", "10/9/2022 10:15" and "10/9/2022 10:15:30"
+         - compare_to: specifies what to save the segment times relative to. It can be:
+            * a float giving the segment time to compare to
+            * equal to "Best Segments" specifying that we should compare to the best segments according to LiveSplit
+            * any other string that is the name of splits from the .lss file
+         - When resets_as_run_kill is set to true, a reset during this segment will be counted as a run kill.
+          This does not work well when you reset for other reasons, like being on a bad pace.
+          Setting this setting to true is best when doing practice runs.
+        """
+        # compare the string dates to integers for easier comparisons
+        min_date_int = np.NINF if min_date is None else day_and_time_to_int(min_date)
+        max_date_int = np.PINF if max_date is None else day_and_time_to_int(max_date)
+        # find the index of the specified segment
+        segment_num = self._get_segment_num(segment)
+        # find what we want to compare the splits to based on the 'compare_to' parameter
+        compare_time = self._get_compare_time(compare_to, segment_num)
         # loop through all attempts between min_date and max_date and extract the times from it
         data = []
         for date_int, real_times, segment_times in self.attempts.values():
@@ -175,14 +203,7 @@ class LSSReader:
         max_date_int = np.PINF if max_date is None else day_and_time_to_int(max_date)
         # find the index of the segment with segment_name as name
         # find the index of the specified segment
-        if isinstance(segment, int):
-            if segment >= len(self.segment_names):
-                raise LSSReadingException(f"Invalid segment index {segment}.")
-            segment_num = segment
-        else:
-            if segment not in self.segment_names:
-                raise LSSReadingException(f"No segment named '{segment}' found.")
-            segment_num = self.segment_names.index(segment)
+        segment_num = self._get_segment_num(segment)
         # loop through all attempts between min_date and max_date and extract the real time from it
         n = 0
         total_time = 0.
@@ -211,3 +232,69 @@ class LSSReader:
         real_time = self.average_real_time_length(segment, min_date, max_date)
         segment_data = self.get_segment_data(segment, min_date, max_date, compare_to)
         return real_time, SplitDistribution.from_data(segment_data, split_step, run_kill_threshold, time_clamp)
+
+    def get_fitted_model_segment(self, segment, component_num=2, min_date=None, max_date=None, compare_to=None,
+                                 resets_as_run_kill=False, run_kill_threshold=np.PINF,
+                                 time_clamp=(np.NINF, np.PINF)) -> Tuple[float, MixtureFit]:
+        """
+        Get the average real time length of segment 'segment' together with a mixture of component_num normal
+        distributions fitted to its segment times for all attempts between min_date and max_date. Use the
+        to_split_distribution method of the fit to get a SplitDistribution at any split_step.
+         - the other arguments are as in get_model_segment and get_segment_data
+        """
+        real_time = self.average_real_time_length(segment, min_date, max_date)
+        segment_data = self.get_segment_data(segment, min_date, max_date, compare_to, resets_as_run_kill)
+        return real_time, MixtureFit.from_data(segment_data, component_num, run_kill_threshold, time_clamp)
+
+    def get_paired_segment_data(self, segment, min_date=None, max_date=None, compare_to=None,
+                                resets_as_run_kill=False) -> list:
+        """
+        Get a list of (segment time, real time) pairs of segment 'segment' for all attempts between min_date and
+        max_date. Attempts where only one of the two times is known are skipped.
+         - segment: an index or a name specifying the segment
+         - min_date, max_date: strings like "10/9/2022", "10/9/2022 10:15" and "10/9/2022 10:15:30"
+         - compare_to: specifies what to save the segment times relative to, see get_segment_data
+         - When resets_as_run_kill is set to true, a reset during this segment will be counted as a run kill, given as
+           the pair ("run kill", real time). The real time until the reset is computed from the times the attempt
+           started and ended and is None when this cannot be done.
+        """
+        # compare the string dates to integers for easier comparisons
+        min_date_int = np.NINF if min_date is None else day_and_time_to_int(min_date)
+        max_date_int = np.PINF if max_date is None else day_and_time_to_int(max_date)
+        segment_num = self._get_segment_num(segment)
+        compare_time = self._get_compare_time(compare_to, segment_num)
+        # loop through all attempts between min_date and max_date and extract the time pairs from it
+        data = []
+        for attempt_id, (date_int, _, _) in self.attempts.items():
+            if not min_date_int <= date_int <= max_date_int:
+                continue
+            paired_times = self.paired_attempt_times[attempt_id]
+            if segment_num in paired_times:
+                segment_time, segment_real_time = paired_times[segment_num]
+                if segment_time is not None and segment_real_time is not None:
+                    data.append((segment_time-compare_time, segment_real_time))
+            elif resets_as_run_kill and all(i in paired_times for i in range(segment_num)) \
+                    and not any(i > segment_num for i in paired_times):
+                # the attempt was reset during this segment, so the real time spent in it is the length of the attempt
+                # minus the real time of the previous segments
+                real_time = None
+                if attempt_id in self.attempt_durations and \
+                        all(paired_times[i][1] is not None for i in range(segment_num)):
+                    real_time = self.attempt_durations[attempt_id] - \
+                                sum(paired_times[i][1] for i in range(segment_num))
+                    real_time = max(real_time, 0.)
+                data.append(("run kill", real_time))
+        return data
+
+    def get_joint_model_segment(self, segment, split_step, real_time_step, min_date=None, max_date=None,
+                                compare_to=None, resets_as_run_kill=False, run_kill_threshold=np.PINF,
+                                time_clamp=(np.NINF, np.PINF)) -> JointSplitDistribution:
+        """
+        Get a JointSplitDistribution of the in game time and real time of segment 'segment' for all attempts between
+        min_date and max_date, to be used in a JointSpeedrunModel.
+         - split_step, real_time_step: the precision to which in game time and real time are made discrete
+         - the other arguments are as in get_model_segment and get_paired_segment_data
+        """
+        segment_data = self.get_paired_segment_data(segment, min_date, max_date, compare_to, resets_as_run_kill)
+        return JointSplitDistribution.from_data(segment_data, split_step, real_time_step, run_kill_threshold,
+                                                time_clamp)
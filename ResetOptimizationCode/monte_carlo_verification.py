@@ -2,8 +2,9 @@
 This file contains some code to verify that the other code still works. It is not commented at all so, it's just meant
 for testing purposes.
 """
-from speedrun_models import BasicSpeedrunModel, SplitDistribution
+from speedrun_models import BasicSpeedrunModel, SplitDistribution, JointSpeedrunModel, JointSplitDistribution
 import random
+import numpy as np
 from lss_reader import LSSReader, time_to_float
 from reset_strategies import get_strategy, BasicStrategy
 
@@ -18,6 +19,15 @@ def sample_dist(dist: SplitDistribution):
     return "reset"
 
 
+def sample_joint_dist(dist: JointSplitDistribution):
+    probabilities = np.concatenate([dist.probabilities.flatten(), dist.run_kill_probabilities])
+    k = min(int(np.searchsorted(np.cumsum(probabilities), random.random())), len(probabilities)-1)
+    i, j = divmod(k, dist.probabilities.shape[1])
+    if i == dist.probabilities.shape[0]:
+        return "reset", dist.start_real_time + dist.real_time_step * j
+    return dist.start_split + dist.split_step * i, dist.start_real_time + dist.real_time_step * j
+
+
 def simulate_prob_of_record(model: BasicSpeedrunModel, iterations: int):
     n = 0
     for _ in range(iterations):
@@ -53,6 +63,27 @@ def simulate_record_density(strategy: BasicStrategy, max_time):
     return record_num/t
 
 
+def simulate_joint_record_density(strategy: BasicStrategy, max_time):
+    model = strategy.model
+    t = model.reset_time
+    record_num = 0
+    while t < max_time:
+        s = 0
+        for i, segment_dist in enumerate(model.joint_distributions):
+            segment_time, segment_real_time = sample_joint_dist(segment_dist)
+            t += segment_real_time
+            if segment_time == "reset":
+                break
+            s += segment_time
+            if i != model.segment_num-1 and s >= strategy.reset_splits[i]-1e-6:
+                break
+        else:
+            if s <= model.goal_split+1e-6:
+                record_num += 1
+        t += model.reset_time
+    return record_num/t
+
+
 def simulate_record_time(strategy: BasicStrategy, max_time: float):
     model = strategy.model
     total_t = 0
@@ -100,6 +131,14 @@ def verify_code_on_model(model: BasicSpeedrunModel, simulate_time: float, iterat
     print(simulate_record_time(strategy, simulate_time))
 
 
+def verify_code_on_joint_model(model: JointSpeedrunModel, simulate_time: float):
+    strategy, record_density = get_strategy(model, print_progress=False)
+    print("The following values should be the same, (the last one only close enough to the first two)")
+    print(1/record_density)
+    print(1/strategy.compute_record_density())
+    print(1/simulate_joint_record_density(strategy, simulate_time))
+
+
 def main():
     # test 1
     split_step = 0.1
@@ -132,6 +171,17 @@ def main():
     verify_code_on_model(model1, 10_000_000, 100_000)
     verify_code_on_model(model2, 10_000_000, 100_000)
 
+    # test 3
+    real_time_step = 0.5
+    segments = [
+        reader.get_joint_model_segment(i, split_step, real_time_step, compare_to="Personal Best", min_date=min_date,
+                                       resets_as_run_kill=True)
+        for i in range(3)
+    ]
+    goal_split = reader.get_relative_split(time_to_float("1:40"), "Personal Best")
+    model = JointSpeedrunModel.from_joint_distributions(segments, goal_split, reset_time)
+    verify_code_on_joint_model(model, 50_000_000)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,207 @@
+"""
+A python file containing classes and methods for computing optimal reset strategies over a grid of parameters in
+parallel.
+"""
+from speedrun_models import BasicSpeedrunModel, SplitDistribution
+from reset_strategies import get_strategy
+from multiprocessing import shared_memory
+import multiprocessing
+import functools
+import itertools
+import json
+import os
+import numpy as np
+from typing import Callable, Dict, Hashable, List, Sequence, Tuple
+
+
+class SweepResults:
+    """
+    A columnar table of the results of a parameter sweep.
+     - columns: a dictionary mapping a column name to the list of values in that column. There is a column for every
+       parameter of the grid together with the columns "cell", "record_density" and "reset_splits".
+    Rows are added in the order that the cells finish, not in the order of the grid.
+    """
+
+    def __init__(self, parameter_names: Sequence[str]):
+        self.columns = {name: [] for name in ["cell", *parameter_names, "record_density", "reset_splits"]}
+
+    # gives the number of rows in the table
+    def __len__(self):
+        return len(self.columns["cell"])
+
+    # add a row to the table given as a dictionary mapping column names to values
+    def append(self, row: Dict):
+        for name, values in self.columns.items():
+            values.append(row[name])
+
+    # get a column of the table as a numpy array
+    def column(self, name: str) -> np.ndarray:
+        return np.array(self.columns[name])
+
+    # get a copy of this table with the rows in the order of the grid
+    def sorted_by_cell(self):
+        order = np.argsort(self.columns["cell"], kind="stable")
+        result = SweepResults([])
+        result.columns = {name: [values[i] for i in order] for name, values in self.columns.items()}
+        return result
+
+
+# get a list of all cells in a parameter grid, a cell being a dictionary mapping each parameter name to a value
+def grid_cells(grid: Dict[str, Sequence]) -> List[Dict]:
+    names = list(grid.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+# encode the parameters of a cell as a string so that cells in a checkpoint file can be compared to cells of the grid
+def _encode_parameters(parameters: Dict) -> str:
+    return json.dumps(parameters, sort_keys=True, default=repr)
+
+
+# the segment library of a worker process and the shared memory block its probability arrays live in
+_worker_library = None
+_worker_shared_memory = None
+
+
+# attach a worker process to the shared memory block and construct SplitDistributions that view into it
+def _init_worker(shared_memory_name: str, library_index: Dict):
+    global _worker_library, _worker_shared_memory
+    _worker_shared_memory = shared_memory.SharedMemory(name=shared_memory_name)
+    buffer = np.ndarray((sum(length for _, length, _, _, _ in library_index.values()),), dtype=float,
+                        buffer=_worker_shared_memory.buf)
+    buffer.flags.writeable = False
+    _worker_library = {key: (real_time, SplitDistribution(start_split, split_step, buffer[offset:offset+length]))
+                       for key, (offset, length, start_split, split_step, real_time) in library_index.items()}
+
+
+# compute the optimal reset strategy for a single cell of the grid using a segment library
+def _solve_cell_with_library(segment_library: Dict, task: Tuple[int, Tuple, float, float, int]):
+    cell_index, segment_keys, goal_split, reset_time, max_iterations = task
+    model = BasicSpeedrunModel.from_segments([segment_library[key] for key in segment_keys], goal_split, reset_time)
+    strategy, record_density = get_strategy(model, max_iterations=max_iterations)
+    return cell_index, float(record_density), [float(s) for s in strategy.reset_splits]
+
+
+# compute the optimal reset strategy for a single cell of the grid using the library of the current worker process
+def _solve_cell(task: Tuple[int, Tuple, float, float, int]):
+    return _solve_cell_with_library(_worker_library, task)
+
+
+# estimate the amount of work a single iteration of update_strategy takes for a model made of the given segments
+def _estimate_cost(distributions: List[SplitDistribution]) -> int:
+    cost = 0
+    split_range_length = 1
+    for dist in distributions:
+        split_range_length += dist.length - 1
+        cost += dist.length * split_range_length
+    return cost
+
+
+def run_parameter_sweep(segment_library: Dict[Hashable, Tuple[float, SplitDistribution]],
+                        grid: Dict[str, Sequence],
+                        build_cell: Callable[[Dict], Tuple[Sequence[Hashable], float, float]], *,
+                        processes: int = None, checkpoint_file: str = None, max_iterations: int = 100,
+                        print_progress=False) -> SweepResults:
+    """
+    Compute the optimal record density and reset strategy for every cell of a parameter grid using a process pool.
+     - segment_library: a dictionary mapping keys to (real time, SplitDistribution) tuples like the ones returned by
+       LSSReader.get_model_segment. Segments with different split steps, date windows or strategies get different keys.
+     - grid: a dictionary mapping parameter names to the list of values to try. The names "cell", "record_density"
+       and "reset_splits" are taken by the columns of the results.
+     - build_cell: a function turning a cell (a dictionary mapping parameter names to values) into a tuple consisting
+       of the list of segment keys of the model, the goal split and the reset time
+     - processes: the number of worker processes, by default the number of cpus. When this is 1 no pool is used.
+     - checkpoint_file: an optional path of a file to which finished cells are written. When the file already exists
+       the cells in it are not recomputed, so an interrupted sweep can be resumed by calling this function again.
+    The probability arrays of the library are placed in shared memory once instead of being sent to each task, and
+    the cells are scheduled from the most to the least expensive to balance the load between the workers.
+    """
+    for name in ["cell", "record_density", "reset_splits"]:
+        if name in grid:
+            raise ValueError(f"The grid parameter '{name}' has the same name as a column of the results.")
+    cells = grid_cells(grid)
+    results = SweepResults(list(grid.keys()))
+    # build the tasks and check that every segment key is in the library
+    tasks = []
+    costs = []
+    for cell_index, parameters in enumerate(cells):
+        segment_keys, goal_split, reset_time = build_cell(parameters)
+        segment_keys = tuple(segment_keys)
+        for key in segment_keys:
+            if key not in segment_library:
+                raise KeyError(f"Cell {parameters} uses the segment {key!r} which is not in the segment library.")
+        tasks.append((cell_index, segment_keys, goal_split, reset_time, max_iterations))
+        costs.append(_estimate_cost([segment_library[key][1] for key in segment_keys]))
+
+    # read the cells that were already computed from the checkpoint file
+    done = set()
+    ends_with_newline = True
+    if checkpoint_file is not None and os.path.exists(checkpoint_file):
+        with open(checkpoint_file, "r") as file:
+            for line in file:
+                ends_with_newline = line.endswith("\n")
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line may be incomplete when the sweep was interrupted while writing it
+                    continue
+                cell_index = row["cell"]
+                if cell_index >= len(cells) or row["parameters"] != _encode_parameters(cells[cell_index]):
+                    raise ValueError(f"The checkpoint file '{checkpoint_file}' does not belong to this grid.")
+                if cell_index not in done:
+                    done.add(cell_index)
+                    results.append({"cell": cell_index, **cells[cell_index],
+                                    "record_density": row["record_density"], "reset_splits": row["reset_splits"]})
+        if print_progress:
+            print(f"Resuming from checkpoint with {len(done)} of {len(cells)} cells done.")
+
+    # schedule the most expensive cells first
+    todo = sorted((i for i in range(len(cells)) if i not in done), key=lambda i: costs[i], reverse=True)
+    if not todo:
+        return results
+
+    # lay out all probability arrays of the library next to each other
+    library_index = dict()
+    offset = 0
+    for key, (real_time, dist) in segment_library.items():
+        library_index[key] = (offset, dist.length, dist.start_split, dist.split_step, real_time)
+        offset += dist.length
+
+    checkpoint = None if checkpoint_file is None else open(checkpoint_file, "a")
+    if checkpoint is not None and not ends_with_newline:
+        # start a new line after a line that was cut off by an interruption
+        checkpoint.write("\n")
+    shared = None
+    pool = None
+    try:
+        if processes == 1:
+            # solve in this process, no need to copy the library anywhere
+            solved = map(functools.partial(_solve_cell_with_library, segment_library), (tasks[i] for i in todo))
+        else:
+            # copy the library into shared memory and start the workers
+            shared = shared_memory.SharedMemory(create=True, size=max(offset, 1)*np.dtype(float).itemsize)
+            buffer = np.ndarray((offset,), dtype=float, buffer=shared.buf)
+            for key, (real_time, dist) in segment_library.items():
+                buffer[library_index[key][0]:library_index[key][0]+dist.length] = dist.probabilities
+            del buffer
+            pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(shared.name, library_index))
+            solved = pool.imap_unordered(_solve_cell, (tasks[i] for i in todo), chunksize=1)
+        # stream the results into the table and the checkpoint file as they come in
+        for cell_index, record_density, reset_splits in solved:
+            results.append({"cell": cell_index, **cells[cell_index],
+                            "record_density": record_density, "reset_splits": reset_splits})
+            if checkpoint is not None:
+                checkpoint.write(json.dumps({"cell": cell_index, "parameters": _encode_parameters(cells[cell_index]),
+                                             "record_density": record_density, "reset_splits": reset_splits}) + "\n")
+                checkpoint.flush()
+            if print_progress:
+                print(f"* finished {len(results)} of {len(cells)} cells")
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if shared is not None:
+            shared.close()
+            shared.unlink()
+        if checkpoint is not None:
+            checkpoint.close()
+    return results
@@ -0,0 +1,181 @@
+"""
+A python file containing classes and methods for computing the distribution of the real time it takes to get a record.
+"""
+from speedrun_models import JointSpeedrunModel, MergedSpeedrunModel
+from reset_strategies import BasicStrategy
+from math import ceil, floor, log
+import dataclasses
+import numpy as np
+from typing import Tuple
+
+
+@dataclasses.dataclass
+class RecordTimeDistribution:
+    """
+    A class for storing the discrete distribution of the total real time until the first record.
+     - real_time_step: describes how real time is discretized. i.e. the possible times are [0, real_time_step, ...]
+     - probabilities: a numpy array of floats where the i'th entry gives the probability of the first record happening
+       after i*real_time_step real time. The probability of it taking longer than the length of the array is at most
+       the tolerance that the distribution was computed with.
+    """
+    real_time_step: float
+    probabilities: np.ndarray
+
+    # gives the probability of the first record happening within i*real_time_step real time for each i
+    @property
+    def cdf(self) -> np.ndarray:
+        return np.minimum(np.cumsum(self.probabilities), 1)
+
+    # gives the expected real time until the first record
+    @property
+    def mean(self) -> float:
+        return float(self.probabilities @ np.arange(len(self.probabilities)) * self.real_time_step)
+
+    # gives the probability of getting a record within real time t
+    def prob_within(self, t: float) -> float:
+        i = floor(t / self.real_time_step)
+        if i < 0:
+            return 0.
+        return float(self.cdf[min(i, len(self.probabilities)-1)])
+
+    # gives the smallest real time t for which the probability of getting a record within t is at least p
+    def quantile(self, p: float) -> float:
+        i = int(np.searchsorted(self.cdf, p, side="left"))
+        if i >= len(self.probabilities):
+            raise ValueError(f"The quantile {p} lies beyond the computed range of real times.")
+        return i * self.real_time_step
+
+
+def get_attempt_outcomes(strategy: BasicStrategy) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute how a single attempt using a strategy can end.
+    output: an array of real times at which the attempt can end without a record (through a reset or a run kill) and
+    an array of the probabilities of it doing so, followed by the same two arrays for the attempt ending in a record
+    For a JointSpeedrunModel the real time of each segment is random and depends on its in game time, so the attempt
+    can end at many different real times. The outcomes of a MergedSpeedrunModel are computed on its original model,
+    since a run killed during a merged block does not take the real time of the rest of the block.
+    """
+    model = strategy.model
+    if isinstance(model, MergedSpeedrunModel):
+        return get_attempt_outcomes(BasicStrategy(model.original_model,
+                                                  model.expand_reset_indices(strategy.reset_indices)))
+    if isinstance(model, JointSpeedrunModel):
+        return _get_joint_attempt_outcomes(strategy)
+    end_times = np.cumsum(model.real_times)
+    fail_probs = np.zeros(model.segment_num, dtype=float)
+    # initialise the distribution of splits
+    distribution = model.segment_distributions[0].copy()
+    fail_probs[0] = distribution.get_run_kill_prob()
+    for i, reset_index in enumerate(strategy.reset_indices):
+        # reset at the end of this segment
+        if reset_index < 0:
+            fail_probs[i] += np.sum(distribution.probabilities)
+            distribution.probabilities[:] = 0
+        else:
+            fail_probs[i] += np.sum(distribution.probabilities[reset_index:])
+            distribution.probabilities[reset_index:] = 0
+        # the run being killed during the next segment
+        fail_probs[i+1] += np.sum(distribution.probabilities) * model.segment_distributions[i+1].get_run_kill_prob()
+        distribution = distribution.convolve(model.segment_distributions[i+1])
+    # not reaching the goal split at the end of the run
+    goal_index = model.goal_index
+    record_prob = float(np.sum(distribution.probabilities[:max(goal_index+1, 0)]))
+    fail_probs[-1] += np.sum(distribution.probabilities) - record_prob
+    return end_times, fail_probs, end_times[-1:], np.array([record_prob])
+
+
+# the full convolution of two 2d arrays, computed using fast fourier transforms
+def _convolve_2d(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    shape = (a.shape[0] + b.shape[0] - 1, a.shape[1] + b.shape[1] - 1)
+    result = np.fft.irfft2(np.fft.rfft2(a, shape) * np.fft.rfft2(b, shape), shape)
+    # get rid of negative rounding errors
+    return np.maximum(result, 0)
+
+
+# compute the outcomes of an attempt like get_attempt_outcomes for a JointSpeedrunModel, keeping track of the joint
+# distribution of the split and the real time of the attempt so far
+def _get_joint_attempt_outcomes(strategy: BasicStrategy) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    model = strategy.model
+    real_time_step = model.joint_distributions[0].real_time_step
+    if any(dist.real_time_step != real_time_step for dist in model.joint_distributions):
+        raise ValueError("All joint distributions should have the same real_time_step.")
+    fail_times = []
+    fail_probs = []
+    # initialise the distribution of (split, real time) pairs. The real time of index j is start_real_time+j*step.
+    first = model.joint_distributions[0]
+    start_real_time = first.start_real_time + model.reset_time
+    distribution = first.probabilities.copy()
+    fail_times.append(start_real_time + real_time_step * np.arange(len(first.run_kill_probabilities)))
+    fail_probs.append(first.run_kill_probabilities)
+    for i, reset_index in enumerate(strategy.reset_indices):
+        # reset at the end of this segment
+        reset_index = max(reset_index, 0)
+        fail_times.append(start_real_time + real_time_step * np.arange(distribution.shape[1]))
+        fail_probs.append(distribution[reset_index:].sum(axis=0))
+        distribution[reset_index:] = 0
+        # the run being killed during the next segment
+        dist = model.joint_distributions[i+1]
+        start_real_time += dist.start_real_time
+        run_kill_probs = np.convolve(distribution.sum(axis=0), dist.run_kill_probabilities)
+        fail_times.append(start_real_time + real_time_step * np.arange(len(run_kill_probs)))
+        fail_probs.append(run_kill_probs)
+        distribution = _convolve_2d(distribution, dist.probabilities)
+    # not reaching the goal split at the end of the run
+    goal_index = max(model.goal_index + 1, 0)
+    record_times = start_real_time + real_time_step * np.arange(distribution.shape[1])
+    fail_times.append(record_times)
+    fail_probs.append(distribution[goal_index:].sum(axis=0))
+    return (np.concatenate(fail_times), np.concatenate(fail_probs), record_times,
+            distribution[:goal_index].sum(axis=0))
+
+
+# discretize a distribution on a finite set of real times, splitting the probability of each time over the two nearest
+# multiples of real_time_step such that the expected time does not change
+def _discretize_times(times: np.ndarray, probabilities: np.ndarray, real_time_step: float, length: int) -> np.ndarray:
+    result = np.zeros(length, dtype=float)
+    positions = times / real_time_step
+    lower = np.floor(positions).astype(int)
+    upper_weights = positions - lower
+    np.add.at(result, lower, probabilities * (1 - upper_weights))
+    np.add.at(result, lower + 1, probabilities * upper_weights)
+    return result
+
+
+def get_record_time_distribution(strategy: BasicStrategy, real_time_step: float = None, tolerance: float = 1e-9,
+                                 max_length: int = 2**20) -> RecordTimeDistribution:
+    """
+    Compute the distribution of the total real time until the first record when repeatedly doing attempts using a
+    strategy.
+     - real_time_step: the precision to which real time is discretized. By default it is chosen as small as possible
+       such that the distribution has at most max_length entries.
+     - tolerance: the probability of the first record taking longer than the computed range of real times may be at
+       most (approximately) this
+    Since attempts are independent, the time until the first record is the sum of a geometric number of failed
+    attempts followed by one successful attempt. Its generating function is S(z)/(1-F(z)) where F and S are the
+    generating functions of the failed and successful attempts, which is evaluated using fast fourier transforms.
+    """
+    fail_times, fail_probs, record_times, record_probs = get_attempt_outcomes(strategy)
+    record_prob = np.sum(record_probs)
+    if record_prob <= 0:
+        raise ValueError("Getting a record is impossible with this strategy!")
+    # the time until the first record is roughly exponentially distributed, so we compute it up to a multiple of its
+    # mean for which the remaining probability is below the tolerance
+    mean = (fail_probs @ fail_times + record_probs @ record_times) / record_prob
+    horizon = mean * (log(1 / tolerance) + 1) + 2 * max(np.max(fail_times), np.max(record_times))
+    if real_time_step is None:
+        real_time_step = horizon / (max_length - 2)
+    length = ceil(horizon / real_time_step) + 1
+    if length > max_length:
+        raise ValueError(f"A real_time_step of {real_time_step} needs {length} entries which is more than "
+                         f"max_length={max_length}.")
+    # compute the distribution of the time until the first record
+    fail_distribution = _discretize_times(fail_times, fail_probs, real_time_step, length)
+    record_distribution = _discretize_times(record_times, record_probs, real_time_step, length)
+    # the probability that wraps around in the circular convolutions is below the tolerance
+    fft_length = 1 << (length - 1).bit_length()
+    fail_transform = np.fft.rfft(fail_distribution, fft_length)
+    record_transform = np.fft.rfft(record_distribution, fft_length)
+    probabilities = np.fft.irfft(record_transform / (1 - fail_transform), fft_length)[:length]
+    # get rid of negative rounding errors
+    probabilities = np.maximum(probabilities, 0)
+    return RecordTimeDistribution(real_time_step, probabilities)
@@ -66,6 +66,22 @@ class BasicStrategy:
         return record_prob / expected_time
 
 
+# the length of the probabilities array above which _correlate_valid uses fast fourier transforms
+_FFT_THRESHOLD = 256
+
+
+# compute np.convolve(probabilities[::-1], values, "valid") for each of the given values arrays. For long probabilities
+# arrays, like the ones of merged segments, this is done using fast fourier transforms.
+def _correlate_valid(probabilities: np.ndarray, *values_arrays: np.ndarray):
+    if len(probabilities) <= _FFT_THRESHOLD:
+        return [np.convolve(probabilities[::-1], values, "valid") for values in values_arrays]
+    full_length = len(probabilities) + len(values_arrays[0]) - 1
+    fft_length = 1 << (full_length - 1).bit_length()
+    transform = np.fft.rfft(probabilities[::-1], fft_length)
+    results = np.fft.irfft(transform * np.fft.rfft(np.array(values_arrays), fft_length), fft_length)
+    return list(results[:, len(probabilities)-1:len(values_arrays[0])])
+
+
 def update_strategy(model: BasicSpeedrunModel, possible_record_density, prob_of_record_out=None) \
         -> Tuple[np.array, float]:
     """
@@ -90,9 +106,9 @@ def update_strategy(model: BasicSpeedrunModel, possible_record_density, prob_of_
         # for each possible split before this segment we calculate the expected time that the rest of the run will take
         # and the probability that the rest of this run will result in a record
         segment_distribution = model.segment_distributions[i]
-        new_expected_time = np.convolve(segment_distribution.probabilities[::-1], expected_time, "valid")
+        new_expected_time, new_prob_of_record = _correlate_valid(segment_distribution.probabilities,
+                                                                 expected_time, prob_of_record)
         new_expected_time += model.real_times[i]
-        new_prob_of_record = np.convolve(segment_distribution.probabilities[::-1], prob_of_record, "valid")
         # use this to compute the record density of the remaining segments if the run is not reset
         continue_record_density = new_prob_of_record / new_expected_time
         # do some binary search to find the smallest split index b where resetting gives a worse record density
@@ -166,3 +182,60 @@ def get_strategy(model: BasicSpeedrunModel, *, max_iterations: int = 100,
         return BasicStrategy(model, last_reset_indices), record_density, prob_of_record_out
     else:
         return BasicStrategy(model, last_reset_indices), record_density
+
+
+@dataclasses.dataclass
+class ResetPointSelection:
+    """
+    The result of choosing at which segment boundaries to allow resets.
+     - strategy: an optimal strategy for the model where resetting is only allowed at the chosen boundaries. Its model
+       is a MergedSpeedrunModel whose reset_boundaries are the chosen boundaries.
+     - record_density: the record density of this strategy
+     - full_record_density: the optimal record density when resetting is allowed at every boundary
+    """
+    strategy: BasicStrategy
+    record_density: float
+    full_record_density: float
+
+    # the chosen boundaries, where boundary i is the end of segment i
+    @property
+    def reset_boundaries(self) -> Tuple[int, ...]:
+        return self.strategy.model.reset_boundaries
+
+    # the fraction of the optimal record density that is lost by only resetting at the chosen boundaries
+    @property
+    def relative_loss(self) -> float:
+        if self.full_record_density == 0:
+            return 0.
+        return 1 - self.record_density / self.full_record_density
+
+
+def select_reset_points(model: BasicSpeedrunModel, reset_point_num: int, *, max_iterations: int = 100,
+                        print_progress=False) -> ResetPointSelection:
+    """
+    Choose reset_point_num segment boundaries at which to allow resets such that the optimal record density is as high
+    as possible, and compute how much record density is lost compared to allowing resets everywhere.
+    The boundaries are chosen greedily: one at a time, the boundary that increases the record density the most is
+    added. Merged blocks of segments are cached on the model, so the many models tried share their convolutions.
+    """
+    _, full_record_density = get_strategy(model, max_iterations=max_iterations)
+    chosen = []
+    candidates = list(range(model.segment_num - 1))
+    # without any reset points every run is completed
+    merged_model = model.merge_segments(chosen)
+    best_strategy = BasicStrategy(merged_model, np.zeros(0, dtype=int))
+    best_record_density = merged_model.prob_of_record() / sum(merged_model.real_times)
+    for _ in range(min(reset_point_num, len(candidates))):
+        # try adding each of the remaining boundaries
+        best_candidate = None
+        for candidate in candidates:
+            strategy, record_density = get_strategy(model.merge_segments(chosen + [candidate]),
+                                                    max_iterations=max_iterations)
+            if best_candidate is None or record_density > best_record_density:
+                best_candidate, best_strategy, best_record_density = candidate, strategy, record_density
+        chosen.append(best_candidate)
+        candidates.remove(best_candidate)
+        if print_progress:
+            print(f"* {len(chosen)} reset points: {sorted(chosen)}")
+            print(f"   - {1/best_record_density = }")
+    return ResetPointSelection(best_strategy, best_record_density, full_record_density)
@@ -0,0 +1,315 @@
+"""
+A python file containing a local service that computes optimal reset strategies for several clients at once.
+
+Clients connect over a unix socket or localhost and send one json object per line of the form
+    {"id": ..., "runner": "...", "model": <model spec>}
+where the model spec is made by model_to_spec. For each request the service sends back json lines with the same id:
+    {"id": ..., "type": "progress", "iteration": ..., "record_density": ..., "reset_splits": [...]}
+for each iteration of update_strategy, followed by exactly one of
+    {"id": ..., "type": "result", "record_density": ..., "reset_indices": [...], "reset_splits": [...]}
+    {"id": ..., "type": "cancelled"}
+    {"id": ..., "type": "error", "message": "..."}
+Identical requests that are being solved at the same time share a single solve, and a request is cancelled when a newer
+request for a different model arrives for the same runner or when its connection is closed (or shut down for writing).
+"""
+from speedrun_models import BasicSpeedrunModel, SplitDistribution
+from reset_strategies import BasicStrategy, update_strategy
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import numpy as np
+from typing import Callable, Dict, Optional
+
+
+# the maximum length of a single json line, model specs with a small split_step can be large
+_LINE_LIMIT = 2**26
+# the maximum number of models a worker process keeps
+_WORKER_MODEL_LIMIT = 16
+
+
+# turn a speedrun model into a dictionary that can be sent as json
+def model_to_spec(model: BasicSpeedrunModel) -> dict:
+    return {"goal_split": model.goal_split,
+            "segments": [{"real_time": real_time, "start_split": dist.start_split, "split_step": dist.split_step,
+                          "probabilities": dist.probabilities.tolist()}
+                         for real_time, dist in zip(model.real_times, model.segment_distributions)]}
+
+
+# turn a dictionary made by model_to_spec back into a speedrun model
+def model_from_spec(spec: dict) -> BasicSpeedrunModel:
+    segments = [(segment["real_time"], SplitDistribution(segment["start_split"], segment["split_step"],
+                                                         np.array(segment["probabilities"], dtype=float)))
+                for segment in spec["segments"]]
+    if len(segments) == 0:
+        raise ValueError("A model needs at least one segment.")
+    return BasicSpeedrunModel.from_segments(segments, spec["goal_split"], spec.get("reset_time", 0))
+
+
+# the models a worker process was sent by their key, with the most recently used model last. A job sends its model
+# only to the workers that do not have it yet instead of with every iteration.
+_worker_models: "OrderedDict[str, BasicSpeedrunModel]" = OrderedDict()
+
+
+# store a model in the current worker process, forgetting the least recently used model when there are too many
+def _cache_model(key: str, model: BasicSpeedrunModel):
+    _worker_models[key] = model
+    _worker_models.move_to_end(key)
+    while len(_worker_models) > _WORKER_MODEL_LIMIT:
+        _worker_models.popitem(last=False)
+
+
+# compute a lower bound for the optimal record density using a strategy of completing every run, like get_strategy
+def _initial_record_density(key: str, model: BasicSpeedrunModel) -> float:
+    _cache_model(key, model)
+    return model.prob_of_record() / sum(model.real_times)
+
+
+# perform an iteration of update_strategy on a model of the current worker process. When the model is not given and
+# the worker does not have it, None is returned and the iteration should be retried with the model.
+def _cached_update_strategy(key: str, record_density: float, model: BasicSpeedrunModel = None):
+    if model is not None:
+        _cache_model(key, model)
+    elif key in _worker_models:
+        _worker_models.move_to_end(key)
+    else:
+        return None
+    return update_strategy(_worker_models[key], record_density)
+
+
+class _Subscription:
+    """
+    A single request waiting for the result of a job.
+    """
+    def __init__(self, runner: str, job, on_progress: Optional[Callable[[dict], None]]):
+        self.runner = runner
+        self.job = job
+        self.on_progress = on_progress
+        self.result = asyncio.get_running_loop().create_future()
+
+    # send the final message of this request, unless it already got one
+    def finish(self, message: dict):
+        if not self.result.done():
+            self.result.set_result(message)
+
+
+class _Job:
+    """
+    A solve of a single model that one or more requests are waiting for.
+    """
+    def __init__(self, key: str, model: BasicSpeedrunModel):
+        self.key = key
+        self.model = model
+        self.subscriptions = set()
+        self.cancelled = False
+        self.task = None
+
+    # send a message to every request waiting for this job
+    def finish(self, message: dict):
+        for subscription in self.subscriptions:
+            subscription.finish(message)
+
+
+class SolveService:
+    """
+    A service that computes optimal reset strategies on a pool of processes.
+     - processes: the number of worker processes, by default the number of cpus
+     - max_iterations: the maximum number of calls to update_strategy per solve, like in get_strategy
+    """
+
+    def __init__(self, processes: int = None, max_iterations: int = 100):
+        self.max_iterations = max_iterations
+        # spawn the workers instead of forking them, such that they do not inherit the sockets of the clients
+        self.executor = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn"))
+        # the jobs that are currently being solved by their key and the latest request of each runner
+        self.jobs: Dict[str, _Job] = dict()
+        self.latest_subscriptions: Dict[str, _Subscription] = dict()
+
+    async def solve(self, runner: str, spec: dict, on_progress: Callable[[dict], None] = None) -> dict:
+        """
+        Compute the optimal reset strategy of the model given by spec and return the final message for this request.
+         - runner: the name of the runner this request is for. An earlier request of the same runner for a different
+           model is cancelled.
+         - on_progress: an optional function that is called with a progress message after each iteration
+        """
+        if not isinstance(runner, str):
+            return {"type": "error", "message": f"The runner should be a string, not {runner!r}."}
+        key = hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+        # find the job for this model, or start one if there is none
+        job = self.jobs.get(key)
+        if job is None:
+            try:
+                model = model_from_spec(spec)
+            except (KeyError, TypeError, ValueError) as e:
+                return {"type": "error", "message": f"Invalid model: {e!r}"}
+            job = _Job(key, model)
+            self.jobs[key] = job
+            job.task = asyncio.create_task(self._run_job(job))
+        # cancel the previous request of this runner if it is for a different model
+        previous = self.latest_subscriptions.get(runner)
+        if previous is not None and previous.job is not job:
+            self._unsubscribe(previous)
+            previous.finish({"type": "cancelled"})
+        subscription = _Subscription(runner, job, on_progress)
+        job.subscriptions.add(subscription)
+        # a job whose requests were all cancelled may not have stopped yet, in which case it can be continued
+        job.cancelled = False
+        self.latest_subscriptions[runner] = subscription
+        try:
+            return await subscription.result
+        finally:
+            # the request got its final message or was cancelled, for example because its client disconnected
+            self._unsubscribe(subscription)
+
+    # stop a request from waiting for its job and cancel the job when no other request is waiting for it
+    def _unsubscribe(self, subscription: _Subscription):
+        job = subscription.job
+        job.subscriptions.discard(subscription)
+        if not job.subscriptions:
+            job.cancelled = True
+        if self.latest_subscriptions.get(subscription.runner) is subscription:
+            del self.latest_subscriptions[subscription.runner]
+
+    # perform the iterations of get_strategy in the process pool, checking for cancellation in between
+    async def _run_job(self, job: _Job):
+        loop = asyncio.get_running_loop()
+        model = job.model
+        try:
+            record_density = await loop.run_in_executor(self.executor, _initial_record_density, job.key, model)
+            # stop early if getting a record is impossible
+            if record_density == 0:
+                reset_indices = np.array(model.split_range_lengths[1:-1])
+                job.finish(self._result_message(model, reset_indices, 0))
+                return
+            last_reset_indices = None
+            for i in range(self.max_iterations):
+                if job.cancelled:
+                    job.finish({"type": "cancelled"})
+                    return
+                result = await loop.run_in_executor(self.executor, _cached_update_strategy, job.key, record_density)
+                if result is None:
+                    # the worker that picked up this iteration does not have the model yet
+                    result = await loop.run_in_executor(self.executor, _cached_update_strategy, job.key,
+                                                        record_density, model)
+                new_reset_indices, record_density = result
+                progress = {"type": "progress", "iteration": i + 1, "record_density": float(record_density),
+                            "reset_splits": [float(s) for s in BasicStrategy(model, new_reset_indices).reset_splits]}
+                for subscription in list(job.subscriptions):
+                    if subscription.on_progress is not None:
+                        subscription.on_progress(progress)
+                # terminate the process when no better strategy can be found
+                if last_reset_indices is not None and (last_reset_indices == new_reset_indices).all():
+                    break
+                last_reset_indices = new_reset_indices
+            job.finish(self._result_message(model, new_reset_indices, record_density))
+        except Exception as e:
+            job.finish({"type": "error", "message": repr(e)})
+        finally:
+            del self.jobs[job.key]
+
+    @staticmethod
+    def _result_message(model: BasicSpeedrunModel, reset_indices: np.ndarray, record_density: float) -> dict:
+        return {"type": "result", "record_density": float(record_density),
+                "reset_indices": [int(i) for i in reset_indices],
+                "reset_splits": [float(s) for s in BasicStrategy(model, reset_indices).reset_splits]}
+
+    # serve a single client connection, handling all its requests concurrently
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def send(request_id, message: dict):
+            if not writer.is_closing():
+                writer.write((json.dumps({"id": request_id, **message}) + "\n").encode())
+
+        async def serve_request(line: bytes):
+            try:
+                request = json.loads(line)
+                request_id = request.get("id")
+                runner, spec = request["runner"], request["model"]
+            except (json.JSONDecodeError, KeyError, AttributeError) as e:
+                send(None, {"type": "error", "message": f"Invalid request: {e!r}"})
+                return
+            message = await self.solve(runner, spec, lambda progress: send(request_id, progress))
+            send(request_id, message)
+            await writer.drain()
+
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(serve_request(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError):
+            # the connection was lost or the client sent a line that is too long
+            pass
+        finally:
+            # the client is gone, so the requests it is still waiting for are cancelled
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    # start listening on a unix socket
+    async def start_unix_server(self, path: str) -> asyncio.AbstractServer:
+        return await asyncio.start_unix_server(self.handle_client, path, limit=_LINE_LIMIT)
+
+    # start listening on localhost
+    async def start_server(self, host: str = "127.0.0.1", port: int = 8765) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle_client, host, port, limit=_LINE_LIMIT)
+
+    # stop the worker processes
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+async def request_solve(runner: str, spec: dict, *, path: str = None, host: str = "127.0.0.1", port: int = 8765,
+                        on_progress: Callable[[dict], None] = None) -> dict:
+    """
+    Send a single request to a running SolveService and return its final message.
+     - path: the path of the unix socket of the service. When it is None the service is reached at host and port.
+     - on_progress: an optional function that is called with each progress message
+    """
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path, limit=_LINE_LIMIT)
+    else:
+        reader, writer = await asyncio.open_connection(host, port, limit=_LINE_LIMIT)
+    try:
+        writer.write((json.dumps({"id": 0, "runner": runner, "model": spec}) + "\n").encode())
+        await writer.drain()
+        while line := await reader.readline():
+            message = json.loads(line)
+            if message["type"] != "progress":
+                return message
+            if on_progress is not None:
+                on_progress(message)
+        raise ConnectionError("The service closed the connection before sending a result.")
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def _serve(args):
+    service = SolveService(args.processes, args.max_iterations)
+    if args.unix is not None:
+        server = await service.start_unix_server(args.unix)
+    else:
+        server = await service.start_server(args.host, args.port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a service that computes optimal reset strategies.")
+    parser.add_argument("--unix", help="the path of a unix socket to listen on instead of localhost")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--max-iterations", type=int, default=100)
+    asyncio.run(_serve(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
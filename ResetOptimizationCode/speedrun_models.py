@@ -3,7 +3,7 @@ A python file containing classes and methods speedrun models.
 """
 import dataclasses
 import numpy as np
-from typing import List
+from typing import List, Tuple
 from math import ceil, exp, floor
 
 
@@ -65,6 +65,67 @@ class SplitDistribution:
         return SplitDistribution(self.start_split, self.split_step, self.probabilities.copy())
 
 
+@dataclasses.dataclass
+class JointSplitDistribution:
+    """
+    A class for storing discrete joint (in game time, real time) distributions of a segment.
+     - start_split and split_step: describe how in game time is discretized, like in SplitDistribution
+     - start_real_time and real_time_step: describe how real time is discretized in the same way
+     - probabilities: a 2d numpy array of floats where the (i, j)'th entry gives the probability of the segment taking
+       start_split+i*split_step in game time and start_real_time+j*real_time_step real time
+     - run_kill_probabilities: a numpy array of floats where the j'th entry gives the probability of the run being
+       killed during this segment after start_real_time+j*real_time_step real time
+    Together the entries of probabilities and run_kill_probabilities add up to 1.
+    """
+    start_split: float
+    split_step: float
+    start_real_time: float
+    real_time_step: float
+    probabilities: np.ndarray
+    run_kill_probabilities: np.ndarray
+
+    # gives the discretized real times
+    @property
+    def real_time_values(self) -> np.ndarray:
+        return self.start_real_time + self.real_time_step*np.arange(self.probabilities.shape[1])
+
+    # gives the in game time distribution of this segment
+    def split_distribution(self) -> SplitDistribution:
+        return SplitDistribution(self.start_split, self.split_step, self.probabilities.sum(axis=1))
+
+    # gives the expected real time spent in this segment, including the real time lost to run kills
+    def expected_real_time(self) -> float:
+        return float((self.probabilities.sum(axis=0) + self.run_kill_probabilities) @ self.real_time_values)
+
+    # creates a JointSplitDistribution from a list of (in game time, real time) pairs. The in game time may be the
+    # string "run kill" and the real time of a run kill may be None when it is unknown. Such run kills are assumed to
+    # take as much real time as the average completed segment.
+    @classmethod
+    def from_data(cls, data_points, split_step, real_time_step, run_kill_threshold=np.PINF,
+                  clamp_range=(np.NINF, np.PINF)):
+        data_points = [(x, t) for x, t in data_points if isinstance(x, str) or clamp_range[0] <= x <= clamp_range[1]]
+        completed = [(x, t) for x, t in data_points if not isinstance(x, str) and x < run_kill_threshold]
+        run_kills = [t for x, t in data_points if isinstance(x, str) or x >= run_kill_threshold]
+        average_real_time = sum(t for x, t in completed)/len(completed)
+        run_kills = [average_real_time if t is None else t for t in run_kills]
+        # discretize both times
+        split_indices = np.array([round(x/split_step) for x, t in completed], dtype=int)
+        real_time_indices = np.array([round(t/real_time_step) for x, t in completed], dtype=int)
+        run_kill_indices = np.array([round(t/real_time_step) for t in run_kills], dtype=int)
+        start_split_index = split_indices.min()
+        start_real_time_index = min(real_time_indices.min(), run_kill_indices.min(initial=real_time_indices.min()))
+        real_time_length = max(real_time_indices.max(), run_kill_indices.max(initial=0)) - start_real_time_index + 1
+        # count the data points
+        probability_unit = 1/len(data_points)
+        probabilities = np.zeros((split_indices.max()-start_split_index+1, real_time_length), dtype=float)
+        np.add.at(probabilities, (split_indices-start_split_index, real_time_indices-start_real_time_index),
+                  probability_unit)
+        run_kill_probabilities = np.zeros(real_time_length, dtype=float)
+        np.add.at(run_kill_probabilities, run_kill_indices-start_real_time_index, probability_unit)
+        return cls(start_split_index*split_step, split_step, start_real_time_index*real_time_step, real_time_step,
+                   probabilities, run_kill_probabilities)
+
+
 class BasicSpeedrunModel:
     """
     A model of a speedrun where the only choice per segment is whether or not to reset.
@@ -89,6 +150,8 @@ class BasicSpeedrunModel:
         self.start_splits = [0]
         for dist in segment_distributions:
             self.start_splits.append(self.start_splits[-1] + dist.start_split)
+        # a cache of merged blocks of consecutive segments, see merged_block
+        self._merged_blocks = dict()
 
     # creates a speedrun model from a list of tuples consisting tuples describing a segment of the run.
     # Each tuple consists of the real time length of the segment together with a SplitDistribution object describing
@@ -105,6 +168,25 @@ class BasicSpeedrunModel:
     def goal_index(self):
         return floor((self.goal_split - self.start_splits[-1]) / self.split_step)
 
+    # gives the real time length and in game time distribution of performing the segments start, ..., end-1 after each
+    # other without resetting in between. The real time length is the expected real time spent in these segments, since
+    # a run killed in one of the segments does not take the real time of the segments after it.
+    def merged_block(self, start: int, end: int) -> Tuple[float, SplitDistribution]:
+        if (start, end) not in self._merged_blocks:
+            if end - start == 1:
+                self._merged_blocks[start, end] = (self.real_times[start], self.segment_distributions[start])
+            else:
+                real_time, distribution = self.merged_block(start, end - 1)
+                self._merged_blocks[start, end] = (
+                    real_time + np.sum(distribution.probabilities) * self.real_times[end - 1],
+                    distribution.convolve(self.segment_distributions[end - 1]))
+        return self._merged_blocks[start, end]
+
+    # creates a model in which resetting is only allowed at the given boundaries, where boundary i is the end of the
+    # i'th segment. All segments in between are merged into a single segment.
+    def merge_segments(self, reset_boundaries):
+        return MergedSpeedrunModel(self, reset_boundaries)
+
     # computes the probability of a run reaching the goal split without resets
     def prob_of_record(self):
         # deal with the edge case that reaching the goal split is impossible
@@ -116,3 +198,58 @@ class BasicSpeedrunModel:
             distribution = distribution.convolve(dist)
         # calculate what the probability of a record
         return np.sum(distribution.probabilities[0:self.goal_index+1])
+
+
+class MergedSpeedrunModel(BasicSpeedrunModel):
+    """
+    A model of a speedrun in which resetting is only allowed at some of the segment boundaries of another model, made
+    by merging the segments in between these boundaries. Solving it takes time proportional to the number of reset
+    points instead of the number of segments.
+     - original_model: the model whose segments are merged
+     - reset_boundaries: a sorted tuple of the segment indices i such that resetting is allowed at the end of segment i
+    """
+
+    def __init__(self, original_model: BasicSpeedrunModel, reset_boundaries):
+        self.original_model = original_model
+        self.reset_boundaries = tuple(sorted(set(reset_boundaries)))
+        if any(not 0 <= i < original_model.segment_num - 1 for i in self.reset_boundaries):
+            raise ValueError(f"The reset boundaries should be between 0 and {original_model.segment_num - 2}.")
+        block_ends = [i + 1 for i in self.reset_boundaries] + [original_model.segment_num]
+        blocks = [original_model.merged_block(start, end) for start, end in zip([0] + block_ends[:-1], block_ends)]
+        super().__init__(len(blocks), original_model.split_step, [t for t, d in blocks], [d for t, d in blocks],
+                         original_model.goal_split)
+
+    # turns the reset indices of a strategy for this model into reset indices for the original model that never reset
+    # at the other boundaries
+    def expand_reset_indices(self, reset_indices) -> np.ndarray:
+        result = np.array(self.original_model.split_range_lengths[1:-1], dtype=int)
+        for boundary, reset_index in zip(self.reset_boundaries, reset_indices):
+            result[boundary] = reset_index
+        return result
+
+
+class JointSpeedrunModel(BasicSpeedrunModel):
+    """
+    A BasicSpeedrunModel where the real time of each segment is not fixed, but given jointly with its in game time by a
+    JointSplitDistribution.
+     - joint_distributions: a list of JointSplitDistributions, one for each segment
+    Since the segments are independent of each other, the expected real time that a segment adds to a run does not
+    depend on the split at the start of the segment. So the backward pass of update_strategy, which carries the
+    expected remaining real time for each split, only needs the expected real time of each segment (including the time
+    lost to run kills) and the strategies of BasicSpeedrunModel can be used without any changes.
+    """
+
+    def __init__(self, segment_num: int, split_step: float, joint_distributions: List[JointSplitDistribution],
+                 goal_split: float, reset_time=0):
+        real_times = [dist.expected_real_time() for dist in joint_distributions]
+        real_times[0] += reset_time
+        super().__init__(segment_num, split_step, real_times,
+                         [dist.split_distribution() for dist in joint_distributions], goal_split)
+        self.joint_distributions = joint_distributions
+        self.reset_time = reset_time
+
+    # creates a joint speedrun model from a list of JointSplitDistribution objects
+    @classmethod
+    def from_joint_distributions(cls, joint_distributions: List[JointSplitDistribution], goal_split, reset_time=0):
+        return JointSpeedrunModel(len(joint_distributions), joint_distributions[0].split_step, joint_distributions,
+                                  goal_split, reset_time)